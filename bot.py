@@ -6,17 +6,30 @@ from pathlib import Path
 import pytz
 from aiogram import Bot, Dispatcher, types
 from aiogram.filters import Command, CommandStart
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, FSInputFile
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
-from config import BOT_TOKEN, REPORT_HOUR, REPORT_MINUTE
+from config import (
+    BOT_TOKEN, ADMIN_IDS, REPORT_HOUR, REPORT_MINUTE, REPORT_SECTION_TTL, PREFETCH_TICK,
+    BROADCAST_NEWS_CONCURRENCY, THROTTLING_STATS_INTERVAL
+)
+from middlewares import ThrottlingMiddleware, OutboundScheduler, bulk_traffic
 from services import generate_report
+from services.delivery import DeliveryWheel
+from services.executor import log_pool_stats, shutdown_pool
+from services.history import ASSETS, format_history
+from services.llm import log_llm_stats
+from services.report import refresh_section
 from services.news import get_news_summary
+from services.prefetch import poll_channels
+from services.profiling import profile_run, ProfilerBusy
 from services.user_sources import (
     get_user_sources, add_user_source, remove_user_source, 
     clear_user_sources, DEFAULT_SOURCES
 )
+from services.user_settings import get_user_settings, set_user_delivery, format_delivery_time
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -25,6 +38,15 @@ bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher()
 scheduler = AsyncIOScheduler(timezone=pytz.timezone('Europe/Moscow'))
 
+throttling = ThrottlingMiddleware()
+dp.message.middleware(throttling)
+dp.callback_query.middleware(throttling)
+
+# Все исходящие запросы к Telegram идут через общий лимит;
+# ответы пользователям обгоняют рассылку
+outbound = OutboundScheduler()
+bot.session.middleware(outbound)
+
 SUBSCRIBERS_FILE = Path(__file__).parent / "subscribers.json"
 
 
@@ -43,6 +65,31 @@ def save_subscribers(subscribers: set):
 
 
 subscribers = load_subscribers()
+delivery_wheel = DeliveryWheel()
+# Администратор, которому отправить профиль следующей рассылки
+broadcast_profile_requester = None
+
+HELP_TEXT = (
+    "📚 Все команды бота:\n\n"
+    
+    "📊 СВОДКИ\n"
+    "/report — финансы, крипта, погода\n"
+    "/news — новостная сводка\n"
+    "/history актив — динамика котировки за неделю\n\n"
+    
+    "📰 НАСТРОЙКИ НОВОСТЕЙ\n"
+    "/sources — мои источники\n"
+    "/addsource ссылка — добавить канал\n"
+    "/removesource — удалить канал\n"
+    "/clearsources — сбросить к стандартным\n\n"
+    
+    "⚙️ ПОДПИСКА\n"
+    "/start — подписаться на рассылку\n"
+    "/stop — отписаться\n"
+    "/time — время и часовой пояс рассылки\n\n"
+    
+    f"📅 По умолчанию рассылка в {REPORT_HOUR:02d}:{REPORT_MINUTE:02d} МСК"
+)
 
 
 def get_main_keyboard():
@@ -67,15 +114,18 @@ async def cmd_start(message: types.Message):
     if chat_id not in subscribers:
         subscribers.add(chat_id)
         save_subscribers(subscribers)
+        delivery_wheel.schedule(chat_id)
         logger.info(f"Новый подписчик: {chat_id}")
     
+    delivery_time = format_delivery_time(get_user_settings(chat_id))
     await message.answer(
         f"👋 Привет! Я бот ежедневных сводок.\n\n"
-        f"📅 Каждый день в {REPORT_HOUR:02d}:{REPORT_MINUTE:02d} МСК отправляю:\n"
+        f"📅 Каждый день в {delivery_time} отправляю:\n"
         f"• Курсы валют и крипты\n"
         f"• Биржевые котировки\n"
         f"• Погоду в Москве\n"
         f"• Персональную подборку новостей\n\n"
+        f"/time — изменить время рассылки\n\n"
         f"Выберите действие:",
         reply_markup=get_main_keyboard()
     )
@@ -84,25 +134,7 @@ async def cmd_start(message: types.Message):
 @dp.message(Command("help"))
 async def cmd_help(message: types.Message):
     """Показывает справку по всем командам."""
-    await message.answer(
-        "📚 Все команды бота:\n\n"
-        
-        "📊 СВОДКИ\n"
-        "/report — финансы, крипта, погода\n"
-        "/news — новостная сводка\n\n"
-        
-        "📰 НАСТРОЙКИ НОВОСТЕЙ\n"
-        "/sources — мои источники\n"
-        "/addsource ссылка — добавить канал\n"
-        "/removesource — удалить канал\n"
-        "/clearsources — сбросить к стандартным\n\n"
-        
-        "⚙️ ПОДПИСКА\n"
-        "/start — подписаться на рассылку\n"
-        "/stop — отписаться\n\n"
-        
-        f"📅 Ежедневная рассылка в {REPORT_HOUR:02d}:{REPORT_MINUTE:02d} МСК"
-    )
+    await message.answer(HELP_TEXT)
 
 
 @dp.callback_query(lambda c: c.data.startswith("action_"))
@@ -113,7 +145,7 @@ async def callback_main_actions(callback: CallbackQuery):
     if action == "report":
         await callback.answer("Собираю данные...")
         try:
-            report = generate_report()
+            report = await generate_report()
             await callback.message.answer(report, parse_mode="Markdown")
         except Exception as e:
             logger.error(f"Ошибка генерации отчета: {e}")
@@ -123,7 +155,7 @@ async def callback_main_actions(callback: CallbackQuery):
         await callback.answer("Собираю новости...")
         user_id = callback.from_user.id
         try:
-            news = get_news_summary(user_id)
+            news = await get_news_summary(user_id)
             await callback.message.answer(f"📰 Новостная сводка:\n\n{news}")
         except Exception as e:
             logger.error(f"Ошибка получения новостей: {e}")
@@ -143,25 +175,7 @@ async def callback_main_actions(callback: CallbackQuery):
         await callback.answer()
     
     elif action == "help":
-        await callback.message.answer(
-            "📚 Все команды бота:\n\n"
-            
-            "📊 СВОДКИ\n"
-            "/report — финансы, крипта, погода\n"
-            "/news — новостная сводка\n\n"
-            
-            "📰 НАСТРОЙКИ НОВОСТЕЙ\n"
-            "/sources — мои источники\n"
-            "/addsource ссылка — добавить канал\n"
-            "/removesource — удалить канал\n"
-            "/clearsources — сбросить к стандартным\n\n"
-            
-            "⚙️ ПОДПИСКА\n"
-            "/start — подписаться на рассылку\n"
-            "/stop — отписаться\n\n"
-            
-            f"📅 Ежедневная рассылка в {REPORT_HOUR:02d}:{REPORT_MINUTE:02d} МСК"
-        )
+        await callback.message.answer(HELP_TEXT)
         await callback.answer()
 
 
@@ -173,25 +187,113 @@ async def cmd_stop(message: types.Message):
     if chat_id in subscribers:
         subscribers.discard(chat_id)
         save_subscribers(subscribers)
+        delivery_wheel.remove(chat_id)
         await message.answer("🔕 Вы отписались от ежедневных сводок.\n/start — подписаться снова")
         logger.info(f"Отписка: {chat_id}")
     else:
         await message.answer("Вы не были подписаны.\n/start — подписаться")
 
 
+@dp.message(Command("time"))
+async def cmd_time(message: types.Message):
+    """Показывает или меняет время и часовой пояс рассылки."""
+    chat_id = message.chat.id
+    args = message.text.split()[1:]
+    
+    if not args:
+        settings = get_user_settings(chat_id)
+        await message.answer(
+            f"🕘 Время рассылки: {format_delivery_time(settings)}\n\n"
+            f"Изменить:\n"
+            f"/time 08:30 — время\n"
+            f"/time Europe/Moscow или /time UTC+3 — часовой пояс\n"
+            f"/time 08:30 Asia/Yekaterinburg — и то и другое"
+        )
+        return
+    
+    success, msg = set_user_delivery(chat_id, args)
+    
+    if success:
+        if chat_id in subscribers:
+            delivery_wheel.schedule(chat_id)
+        else:
+            msg += "\n\n/start — подписаться на рассылку"
+        await message.answer(f"✅ {msg}")
+    else:
+        await message.answer(f"❌ {msg}")
+
+
 @dp.message(Command("report"))
 async def cmd_report(message: types.Message):
     """Обработчик команды /report — ручной запрос сводки."""
     await message.answer("⏳ Собираю данные...")
     
     try:
-        report = generate_report()
+        report = await generate_report()
         await message.answer(report, parse_mode="Markdown")
     except Exception as e:
         logger.error(f"Ошибка генерации отчета: {e}")
         await message.answer("❌ Ошибка при получении данных")
 
 
+@dp.message(Command("history"))
+async def cmd_history(message: types.Message):
+    """Показывает историю котировки из локального хранилища."""
+    args = message.text.split(maxsplit=1)
+    asset = args[1].strip().lower() if len(args) > 1 else ""
+    
+    if asset not in ASSETS:
+        assets_list = "\n".join([f"  {key} — {name}" for key, name in ASSETS.items()])
+        await message.answer(
+            f"❓ Укажите актив:\n{assets_list}\n\n"
+            f"Например: /history usd"
+        )
+        return
+    
+    await message.answer(format_history(asset))
+
+
+@dp.message(Command("profile"))
+async def cmd_profile(message: types.Message):
+    """Профилирование для администраторов: /profile report | news | broadcast."""
+    global broadcast_profile_requester
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("⛔ Команда доступна только администраторам")
+        return
+    
+    args = message.text.split()
+    target = args[1].lower() if len(args) > 1 else ""
+    
+    if target == "broadcast":
+        broadcast_profile_requester = message.chat.id
+        await message.answer("⏱ Профиль следующей рассылки будет отправлен вам")
+        return
+    
+    if target not in ("report", "news"):
+        await message.answer(
+            "❓ Что профилировать:\n"
+            "/profile report — сборка сводки (без кэша)\n"
+            "/profile news — новостная сводка\n"
+            "/profile broadcast — следующая рассылка"
+        )
+        return
+    
+    await message.answer(f"⏱ Профилирую {target}...")
+    try:
+        async with profile_run(target) as session:
+            if target == "report":
+                await generate_report(force=True)
+            else:
+                await get_news_summary(message.from_user.id)
+    except ProfilerBusy as e:
+        await message.answer(f"❌ {e}")
+        return
+    except Exception as e:
+        logger.error(f"Ошибка при профилировании {target}: {e}")
+    
+    await send_profile(message.chat.id, session)
+
+
 @dp.message(Command("news"))
 async def cmd_news(message: types.Message):
     """Обработчик команды /news — получить новостную сводку."""
@@ -201,7 +303,7 @@ async def cmd_news(message: types.Message):
     await message.answer(f"📰 Собираю новости из {len(sources)} источников...")
     
     try:
-        news = get_news_summary(user_id)
+        news = await get_news_summary(user_id)
         await message.answer(f"📰 *Новостная сводка:*\n\n{news}", parse_mode="Markdown")
     except Exception as e:
         logger.error(f"Ошибка получения новостей: {e}")
@@ -301,32 +403,91 @@ async def cmd_clearsources(message: types.Message):
     await message.answer(f"✅ {msg}\n\nСтандартный источник: @{DEFAULT_SOURCES[0]}")
 
 
-async def send_daily_report():
-    """Отправляет ежедневный отчет с новостями всем подписчикам."""
-    if not subscribers:
-        logger.info("Нет подписчиков для рассылки")
+async def send_profile(chat_id: int, session):
+    """Отправляет администратору сводку профиля и файлы дампов."""
+    summary = session.summary or "Не удалось собрать профиль"
+    # Ограничение Telegram на длину сообщения
+    await bot.send_message(chat_id, summary[:4000])
+    for path in session.files:
+        await bot.send_document(chat_id, FSInputFile(path))
+
+
+async def send_daily_report(chat_ids: list):
+    """Отправляет отчет с новостями пачке подписчиков из одной корзины."""
+    global broadcast_profile_requester
+    if broadcast_profile_requester is not None:
+        admin_id, broadcast_profile_requester = broadcast_profile_requester, None
+        try:
+            async with profile_run("broadcast") as session:
+                await _send_daily_report(chat_ids)
+        except ProfilerBusy as e:
+            # Профилируем следующую пачку, раз администратору обещан профиль рассылки
+            if broadcast_profile_requester is None:
+                broadcast_profile_requester = admin_id
+            logger.warning(f"Рассылка не профилирована, профиль будет снят со следующей пачки: {e}")
+            await _send_daily_report(chat_ids)
+            return
+        await send_profile(admin_id, session)
+    else:
+        await _send_daily_report(chat_ids)
+
+
+async def _send_daily_report(chat_ids: list):
+    """Собирает сводку и новости и рассылает их подписчикам пачки."""
+    try:
+        report = await generate_report()
+    except Exception as e:
+        logger.error(f"Ошибка генерации отчета: {e}")
         return
     
-    try:
-        report = generate_report()
-        
-        for chat_id in subscribers.copy():
+    # Сводки готовятся параллельно, но не больше BROADCAST_NEWS_CONCURRENCY
+    # сразу: иначе большая корзина переполнит очередь DeepSeek, и вместо
+    # новостей подписчики получат текст ошибки
+    news_slots = asyncio.Semaphore(BROADCAST_NEWS_CONCURRENCY)
+    
+    async def deliver(chat_id: int):
+        try:
+            # Получаем персональные новости для каждого пользователя
+            user_report = report
             try:
-                # Получаем персональные новости для каждого пользователя
-                user_report = report
-                try:
-                    news = get_news_summary(chat_id)
-                    user_report += f"\n\n📰 *Новости:*\n{news}"
-                except Exception as e:
-                    logger.error(f"Ошибка получения новостей для {chat_id}: {e}")
-                
-                await bot.send_message(chat_id, user_report, parse_mode="Markdown")
+                async with news_slots:
+                    news = await get_news_summary(chat_id)
+                user_report += f"\n\n📰 *Новости:*\n{news}"
             except Exception as e:
-                logger.error(f"Ошибка отправки в {chat_id}: {e}")
-        
-        logger.info(f"Отчет отправлен {len(subscribers)} подписчикам")
-    except Exception as e:
-        logger.error(f"Ошибка генерации отчета: {e}")
+                logger.error(f"Ошибка получения новостей для {chat_id}: {e}")
+            
+            # Рассылка получает только остаток лимита после интерактивных ответов
+            with bulk_traffic():
+                await bot.send_message(chat_id, user_report, parse_mode="Markdown")
+        except Exception as e:
+            logger.error(f"Ошибка отправки в {chat_id}: {e}")
+    
+    await asyncio.gather(*[deliver(chat_id) for chat_id in chat_ids])
+    
+    logger.info(f"Отчет отправлен {len(chat_ids)} подписчикам")
+    log_pool_stats()
+    log_llm_stats()
+    outbound.log_stats()
+    throttling.log_stats()
+
+
+async def process_delivery_tick():
+    """Каждую минуту забирает из колеса доставки чаты, которым пора слать отчет."""
+    for chat_ids in delivery_wheel.pop_due():
+        # Чат мог отписаться, пока лежал в корзине
+        chat_ids = [chat_id for chat_id in chat_ids if chat_id in subscribers]
+        if chat_ids:
+            await send_daily_report(chat_ids)
+
+
+async def rebuild_delivery_wheel():
+    """
+    Пересобирает колесо доставки (учитывает переходы на летнее время).
+
+    Корутина, чтобы планировщик выполнял её в event loop, а не в потоке,
+    параллельно с тиком доставки и обработчиками /start и /stop.
+    """
+    delivery_wheel.rebuild(subscribers.copy())
 
 
 async def main():
@@ -334,16 +495,49 @@ async def main():
     if not BOT_TOKEN:
         raise ValueError("BOT_TOKEN не установлен! Задайте переменную окружения.")
     
+    await rebuild_delivery_wheel()
+    scheduler.add_job(
+        process_delivery_tick,
+        CronTrigger(minute="*"),
+        id="delivery_wheel",
+        max_instances=1
+    )
+    scheduler.add_job(
+        rebuild_delivery_wheel,
+        CronTrigger(minute=30, second=30),
+        id="delivery_wheel_rebuild",
+        max_instances=1
+    )
+    # Разделы сводки обновляются в фоне каждый со своей частотой
+    for section, ttl in REPORT_SECTION_TTL.items():
+        scheduler.add_job(
+            refresh_section,
+            IntervalTrigger(seconds=ttl),
+            args=[section],
+            id=f"report_section_{section}",
+            max_instances=1
+        )
+    # Счётчики отложенных и отклонённых дорогих команд
     scheduler.add_job(
-        send_daily_report,
-        CronTrigger(hour=REPORT_HOUR, minute=REPORT_MINUTE),
-        id="daily_report"
+        throttling.log_stats,
+        IntervalTrigger(seconds=THROTTLING_STATS_INTERVAL),
+        id="throttling_stats"
+    )
+    # Каналы подписчиков опрашиваются в фоне, /news отвечает из хранилища постов
+    scheduler.add_job(
+        poll_channels,
+        IntervalTrigger(seconds=PREFETCH_TICK),
+        id="news_prefetch",
+        max_instances=1
     )
     scheduler.start()
-    logger.info(f"Планировщик запущен: отчеты в {REPORT_HOUR:02d}:{REPORT_MINUTE:02d} МСК")
+    logger.info("Планировщик запущен: рассылка по персональному времени подписчиков")
     logger.info(f"Подписчиков: {len(subscribers)}")
     
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        shutdown_pool()
 
 
 if __name__ == "__main__":
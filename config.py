@@ -6,9 +6,80 @@ load_dotenv()
 # Telegram Bot Token (из .env файла)
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 
-# Время отправки ежедневного отчета (Москва)
+# Администраторы бота (ID через запятую) — им доступна команда /profile
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()}
+
+# Время отправки ежедневного отчета по умолчанию (Москва)
 REPORT_HOUR = 9
 REPORT_MINUTE = 0
+DEFAULT_TIMEZONE = "Europe/Moscow"
+
+# Сколько пропущенных минут доставки догонять после простоя планировщика
+DELIVERY_CATCHUP_MINUTES = 60
+
+# Пул для CPU-тяжёлых задач (парсинг HTML, pandas): "thread" или "process".
+# "process" задействует несколько ядер, "thread" дешевле по памяти
+CPU_POOL_KIND = os.getenv("CPU_POOL_KIND", "thread")
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", os.cpu_count() or 2))
+# Сколько задач может стоять в очереди сверх занятых воркеров;
+# остальные вызывающие ждут (back-pressure), а не копят задачи в памяти
+CPU_POOL_QUEUE_SIZE = int(os.getenv("CPU_POOL_QUEUE_SIZE", 32))
+# Ожидание в очереди (сек), после которого пишем предупреждение в лог
+CPU_POOL_WAIT_WARNING = 1.0
+
+# Как часто обновлять разделы сводки (сек): погода меняется раз в час,
+# крипта — постоянно. Раздел с ошибкой повторяем через REPORT_SECTION_RETRY
+REPORT_SECTION_TTL = {
+    "currency": 600,
+    "crypto": 120,
+    "commodities": 900,
+    "weather": 3600,
+}
+REPORT_SECTION_RETRY = 60
+
+# Фоновое обновление новостей подписанных каналов. Частота опроса канала
+# подстраивается под то, как часто он публикует посты
+PREFETCH_TICK = 15                # сек между проверками расписания опроса
+PREFETCH_MIN_INTERVAL = 120       # самый частый опрос одного канала, сек
+PREFETCH_MAX_INTERVAL = 3600      # самый редкий опрос одного канала, сек
+PREFETCH_TARGET_NEW_POSTS = 2     # сколько новых постов в среднем ждём между опросами
+PREFETCH_BUDGET_PER_MINUTE = 20   # глобальный лимит запросов к t.me в минуту
+
+# Ограничение дорогих команд. Стоимость — в условных единицах нагрузки
+# (/news = парсинг каналов + платный запрос в DeepSeek)
+COMMAND_COSTS = {"news": 5, "report": 2}
+# Персональный лимит: запас единиц и скорость его восстановления
+USER_COST_BURST = 10
+USER_COST_PER_MINUTE = 10
+# Глобальный лимит: единиц в минуту и единиц, выполняющихся одновременно
+GLOBAL_COST_PER_MINUTE = 300
+GLOBAL_COST_CAPACITY = 40
+# Очередь допуска: сколько запросов может ждать и сколько секунд
+ADMISSION_QUEUE_SIZE = 50
+ADMISSION_TIMEOUT = 10
+# Как часто писать в лог счётчики ограничения (секунд)
+THROTTLING_STATS_INTERVAL = 600
+
+# Исходящие сообщения: общий лимит на токен бота для всех отправок.
+# Ответы пользователям идут вне очереди, рассылка — на остаток лимита
+OUTBOUND_RATE = 25                  # сообщений в секунду (лимит Telegram ~30)
+OUTBOUND_BURST = 5
+OUTBOUND_INTERACTIVE_QUEUE = 1000
+OUTBOUND_BULK_QUEUE = 100
+OUTBOUND_MAX_RETRIES = 2            # повторы после flood wait (429)
 
 # DeepSeek API
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "")
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+DEEPSEEK_MODEL = "deepseek-chat"
+DEEPSEEK_TIMEOUT = 60
+# Сколько запросов к DeepSeek выполняется одновременно и сколько может ждать
+DEEPSEEK_CONCURRENCY = int(os.getenv("DEEPSEEK_CONCURRENCY", 4))
+DEEPSEEK_MAX_QUEUE = int(os.getenv("DEEPSEEK_MAX_QUEUE", 500))
+# Сколько сводок новостей рассылка готовит одновременно. Рассылка не должна
+# упираться в DEEPSEEK_MAX_QUEUE: переполнение очереди превращается в текст ошибки
+BROADCAST_NEWS_CONCURRENCY = min(DEEPSEEK_CONCURRENCY * 2, DEEPSEEK_MAX_QUEUE)
+# Повторы при 429/5xx и сетевых ошибках: экспоненциальная пауза со случайным разбросом
+DEEPSEEK_MAX_RETRIES = 4
+DEEPSEEK_BACKOFF_BASE = 1.0
+DEEPSEEK_BACKOFF_MAX = 30.0
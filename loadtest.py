@@ -0,0 +1,270 @@
+"""
+Нагрузочный тест обработчиков bot.py без сети.
+
+Синтетические сообщения и нажатия кнопок подаются прямо в dp.feed_update,
+запросы к Telegram API уходят в фейковую сессию, а внешние источники
+(курсы, t.me, DeepSeek) заменены заглушками с настраиваемой задержкой.
+Кэши, single-flight, CPU-пул и ограничения работают как в проде.
+
+Пример:
+    python loadtest.py --updates 2000 --concurrency 100 --users 300
+    python loadtest.py --mix start,report,action_news --no-throttle
+    python loadtest.py --updates 300 --outbound-limit
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+
+# Бот с настоящим токеном не нужен: запросы к API не покидают процесс
+os.environ.setdefault("BOT_TOKEN", "123456:LOADTEST")
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMessage, EditMessageText, EditMessageReplyMarkup
+from aiogram.types import Update, Message, Chat
+
+import bot as bot_module
+import services.history as history
+import services.news as news
+import services.report as report
+import services.user_sources as user_sources
+import services.user_settings as user_settings
+from services.executor import get_pool_stats, shutdown_pool
+from services.singleflight import get_single_flight_stats
+
+SCENARIOS = ["start", "report", "news", "sources", "action_report", "action_news", "remove"]
+EXTRA_CHANNEL = "loadtest_channel"
+
+
+class FakeSession(BaseSession):
+    """Сессия aiogram, которая ничего не отправляет, а только записывает вызовы API."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = Counter()
+        self._message_id = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls[type(method).__name__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if isinstance(method, (SendMessage, EditMessageText, EditMessageReplyMarkup)):
+            self._message_id += 1
+            return Message(
+                message_id=self._message_id,
+                date=datetime.now(),
+                chat=Chat(id=method.chat_id or 0, type="private"),
+                text=getattr(method, "text", None),
+            )
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def install_fake_upstreams(latency: float):
+    """Подменяет внешние источники заглушками с задержкой latency секунд."""
+
+    def slow(value):
+        def fake(*args, **kwargs):
+            time.sleep(latency)
+            return value
+        return fake
+
+    async def fake_commodities():
+        await asyncio.sleep(latency)
+        return {"usd": 92.5, "brent": 80.1, "urals": 65.3, "gold": 2400.0, "silver": 30.2}
+
+    post = (
+        '<div class="tgme_widget_message" data-post="{channel}/{i}">'
+        '<div class="tgme_widget_message_text js-message_text">Синтетическая новость номер {i} для теста</div>'
+        '</div>'
+    )
+
+    def fake_channel_html(url):
+        time.sleep(latency)
+        channel = url.rsplit("/", 1)[-1]
+        return "".join(post.format(channel=channel, i=i) for i in range(20))
+
+    report.get_currency = slow(92.5)
+    report.get_bitcoin_rate = slow(65000)
+    report.get_ethereum_rate = slow(3500)
+    report.get_all_commodities = fake_commodities
+    report.get_weather = slow(None)
+    async def fake_summary(news_list):
+        await asyncio.sleep(latency)
+        return "• Синтетическая сводка"
+
+    news.fetch_channel_html = fake_channel_html
+    news.summarize_news = fake_summary
+
+
+def isolate_storage():
+    """Переносит все файлы бота во временный каталог."""
+    tmp = Path(tempfile.mkdtemp(prefix="loadtest_"))
+    bot_module.SUBSCRIBERS_FILE = tmp / "subscribers.json"
+    bot_module.subscribers.clear()
+    user_sources.SOURCES_FILE = tmp / "user_sources.json"
+    user_settings.SETTINGS_FILE = tmp / "user_settings.json"
+    history.HISTORY_DIR = tmp / "history"
+    return tmp
+
+
+def seed_sources(users: int):
+    """Даёт каждому пользователю лишний канал, чтобы remove_* было что удалять."""
+    data = {
+        str(user_id): user_sources.DEFAULT_SOURCES + [EXTRA_CHANNEL]
+        for user_id in range(1, users + 1)
+    }
+    user_sources.save_all_sources(data)
+
+
+def make_update(update_id: int, scenario: str, user_id: int, bot: Bot) -> Update:
+    """Собирает синтетический Update для сценария."""
+    user = {"id": user_id, "is_bot": False, "first_name": "Load"}
+    chat = {"id": user_id, "type": "private"}
+    now = int(time.time())
+
+    if scenario.startswith("action_") or scenario == "remove":
+        data = scenario if scenario.startswith("action_") else f"remove_{EXTRA_CHANNEL}"
+        payload = {
+            "callback_query": {
+                "id": str(update_id),
+                "from": user,
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {"message_id": update_id, "date": now, "chat": chat, "text": "menu"},
+            }
+        }
+    else:
+        payload = {
+            "message": {
+                "message_id": update_id,
+                "date": now,
+                "chat": chat,
+                "from": user,
+                "text": f"/{scenario}",
+            }
+        }
+    return Update.model_validate({"update_id": update_id, **payload}, context={"bot": bot})
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def run(args) -> int:
+    session = FakeSession(args.api_latency)
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=session)
+    dp = bot_module.dp
+    if args.outbound_limit:
+        session.middleware(bot_module.outbound)
+
+    if args.no_throttle:
+        dp.message.middleware.unregister(bot_module.throttling)
+        dp.callback_query.middleware.unregister(bot_module.throttling)
+
+    mix = args.mix.split(",")
+    unknown = set(mix) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Неизвестные сценарии: {', '.join(sorted(unknown))}")
+
+    rng = random.Random(args.seed)
+    plan = [(i, rng.choice(mix), rng.randint(1, args.users)) for i in range(1, args.updates + 1)]
+    slots = asyncio.Semaphore(args.concurrency)
+    latencies = defaultdict(list)
+    errors = Counter()
+
+    async def feed(update_id: int, scenario: str, user_id: int):
+        async with slots:
+            update = make_update(update_id, scenario, user_id, bot)
+            started = time.perf_counter()
+            try:
+                await dp.feed_update(bot, update)
+            except Exception as e:
+                errors[f"{scenario}: {type(e).__name__}"] += 1
+            latencies[scenario].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[feed(*item) for item in plan])
+    elapsed = time.perf_counter() - started
+
+    print(f"\nОбновлений: {args.updates}, параллельно: {args.concurrency}, пользователей: {args.users}")
+    print(f"Время: {elapsed:.2f} с, пропускная способность: {args.updates / elapsed:.1f} обн/с\n")
+    print(f"{'сценарий':<16}{'кол-во':>8}{'p50, мс':>10}{'p99, мс':>10}{'макс, мс':>10}")
+    all_latencies = []
+    for scenario in mix:
+        values = latencies.get(scenario, [])
+        if not values:
+            continue
+        all_latencies.extend(values)
+        print(
+            f"{scenario:<16}{len(values):>8}{percentile(values, 50) * 1000:>10.1f}"
+            f"{percentile(values, 99) * 1000:>10.1f}{max(values) * 1000:>10.1f}"
+        )
+    print(
+        f"{'всего':<16}{len(all_latencies):>8}{percentile(all_latencies, 50) * 1000:>10.1f}"
+        f"{percentile(all_latencies, 99) * 1000:>10.1f}{max(all_latencies) * 1000:>10.1f}"
+    )
+
+    print("\nВызовы Telegram API:")
+    for method, count in session.calls.most_common():
+        print(f"  {method}: {count}")
+    if not args.no_throttle:
+        print(f"\nОграничение запросов: {bot_module.throttling.get_stats()}")
+    if args.outbound_limit:
+        print(f"Исходящая очередь: {bot_module.outbound.get_stats()}")
+    print(f"Single-flight: {get_single_flight_stats()}")
+    print(f"CPU-пул: {get_pool_stats()}")
+    if errors:
+        print("\nОшибки обработчиков:")
+        for error, count in errors.most_common():
+            print(f"  {error}: {count}")
+    return 1 if errors else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест обработчиков бота без сети")
+    parser.add_argument("--updates", type=int, default=1000, help="сколько обновлений подать")
+    parser.add_argument("--concurrency", type=int, default=50, help="сколько обновлений обрабатывать одновременно")
+    parser.add_argument("--users", type=int, default=200, help="сколько разных пользователей")
+    parser.add_argument("--mix", default=",".join(SCENARIOS), help=f"сценарии через запятую: {', '.join(SCENARIOS)}")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка фейкового Telegram API, с")
+    parser.add_argument("--upstream-latency", type=float, default=0.05, help="задержка заглушек внешних источников, с")
+    parser.add_argument("--no-throttle", action="store_true", help="отключить ограничение дорогих команд")
+    parser.add_argument("--outbound-limit", action="store_true", help="пропускать ответы через лимит исходящих сообщений")
+    parser.add_argument("--seed", type=int, default=1, help="seed генератора сценариев")
+    parser.add_argument("--log-level", default="ERROR", help="уровень логов бота во время теста")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    storage = isolate_storage()
+    seed_sources(args.users)
+    install_fake_upstreams(args.upstream_latency)
+    print(f"Файлы бота: {storage}")
+
+    try:
+        code = asyncio.run(run(args))
+    finally:
+        shutdown_pool()
+    raise SystemExit(code)
+
+
+if __name__ == "__main__":
+    main()
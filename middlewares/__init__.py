@@ -0,0 +1,2 @@
+from .throttling import ThrottlingMiddleware
+from .outbound import OutboundScheduler, bulk_traffic
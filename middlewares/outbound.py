@@ -0,0 +1,157 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import asyncio
+import logging
+import time
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import (
+    OUTBOUND_RATE, OUTBOUND_BURST, OUTBOUND_INTERACTIVE_QUEUE,
+    OUTBOUND_BULK_QUEUE, OUTBOUND_MAX_RETRIES
+)
+from .throttling import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+# Методы API, которые что-то отправляют пользователю и расходуют лимит
+LIMITED_PREFIXES = ("send", "edit", "copy", "forward", "answer")
+
+_priority = ContextVar("outbound_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def bulk_traffic():
+    """Помечает запросы к Telegram внутри блока как массовую рассылку."""
+    token = _priority.set(BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Планировщик исходящих запросов к Telegram.
+
+    Все отправки через сессию бота делят один лимит OUTBOUND_RATE.
+    Ответы пользователям (INTERACTIVE) всегда идут раньше рассылки (BULK),
+    так что рассылка получает только оставшуюся пропускную способность.
+    Очереди ограничены: при переполнении отправитель ждёт места.
+    При flood wait (429) вся отправка ставится на паузу.
+    """
+
+    def __init__(self):
+        self.bucket = TokenBucket(OUTBOUND_BURST, OUTBOUND_RATE)
+        self.queues = None
+        self.paused_until = 0.0
+        self._has_work = None
+        self._worker = None
+        self.stats = {
+            INTERACTIVE: {"sent": 0, "total_wait": 0.0, "max_wait": 0.0},
+            BULK: {"sent": 0, "total_wait": 0.0, "max_wait": 0.0},
+            "flood_waits": 0,
+        }
+
+    def _start(self):
+        # Очереди и воркер привязаны к event loop, поэтому создаются при первом запросе
+        self.queues = {
+            INTERACTIVE: asyncio.Queue(OUTBOUND_INTERACTIVE_QUEUE),
+            BULK: asyncio.Queue(OUTBOUND_BULK_QUEUE),
+        }
+        self._has_work = asyncio.Event()
+        self._worker = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def __call__(self, make_request, bot, method):
+        if not method.__api_method__.lower().startswith(LIMITED_PREFIXES):
+            return await make_request(bot, method)
+
+        priority = _priority.get()
+        for attempt in range(OUTBOUND_MAX_RETRIES + 1):
+            wait = await self._wait_turn(priority)
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.stats["flood_waits"] += 1
+                self.paused_until = max(self.paused_until, time.monotonic() + e.retry_after)
+                logger.warning(f"Flood wait {e.retry_after} с на {method.__api_method__} ({priority})")
+                if attempt == OUTBOUND_MAX_RETRIES:
+                    raise
+                continue
+
+            stats = self.stats[priority]
+            stats["sent"] += 1
+            stats["total_wait"] += wait
+            stats["max_wait"] = max(stats["max_wait"], wait)
+            return result
+
+    async def _wait_turn(self, priority: str) -> float:
+        """Встаёт в очередь своего класса, ждёт разрешения на отправку и возвращает время ожидания."""
+        if self._worker is None or self._worker.done():
+            self._start()
+
+        turn = asyncio.get_running_loop().create_future()
+        enqueued_at = time.monotonic()
+        await self.queues[priority].put(turn)
+        self._has_work.set()
+        await turn
+        return time.monotonic() - enqueued_at
+
+    def _next_turn(self):
+        """Следующий ожидающий: сначала интерактивные, потом рассылка."""
+        for priority in (INTERACTIVE, BULK):
+            queue = self.queues[priority]
+            while not queue.empty():
+                turn = queue.get_nowait()
+                if not turn.cancelled():
+                    return turn
+        return None
+
+    async def _dispatch(self):
+        """Выдаёт разрешения на отправку с частотой не выше лимита."""
+        while True:
+            await self._has_work.wait()
+
+            # Сначала ждём свободный лимит и только потом выбираем, кому его отдать,
+            # чтобы пришедший за это время интерактивный запрос обогнал рассылку
+            delay = max(self.paused_until - time.monotonic(), self.bucket.time_until(1))
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            turn = self._next_turn()
+            if turn is None:
+                self._has_work.clear()
+                continue
+            self.bucket.try_take(1)
+            turn.set_result(None)
+
+    def get_stats(self) -> dict:
+        """Возвращает число отправок и ожидание в очереди по классам."""
+        result = {"flood_waits": self.stats["flood_waits"]}
+        for priority in (INTERACTIVE, BULK):
+            stats = self.stats[priority]
+            sent = stats["sent"]
+            result[priority] = {
+                "sent": sent,
+                "queued": self.queues[priority].qsize() if self.queues else 0,
+                "avg_wait": stats["total_wait"] / sent if sent else 0.0,
+                "max_wait": stats["max_wait"],
+            }
+        return result
+
+    def log_stats(self):
+        """Пишет метрики исходящей очереди в лог."""
+        stats = self.get_stats()
+        for priority in (INTERACTIVE, BULK):
+            s = stats[priority]
+            logger.info(
+                f"Исходящие {priority}: отправлено {s['sent']}, в очереди {s['queued']}, "
+                f"ожидание ср. {s['avg_wait'] * 1000:.0f} мс / макс. {s['max_wait'] * 1000:.0f} мс"
+            )
+        if stats["flood_waits"]:
+            logger.warning(f"Flood wait от Telegram: {stats['flood_waits']}")
@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import math
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message
+
+from config import (
+    COMMAND_COSTS, USER_COST_BURST, USER_COST_PER_MINUTE,
+    GLOBAL_COST_PER_MINUTE, GLOBAL_COST_CAPACITY,
+    ADMISSION_QUEUE_SIZE, ADMISSION_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+# Сколько персональных лимитов держим, прежде чем чистить простаивающие
+MAX_TRACKED_USERS = 10000
+
+
+class TokenBucket:
+    """Маркерная корзина: запас capacity единиц, пополняется со скоростью rate в секунду."""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_take(self, amount: float) -> bool:
+        """Списывает amount единиц, если они есть."""
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def refund(self, amount: float):
+        """Возвращает ранее списанные единицы."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def time_until(self, amount: float) -> float:
+        """Через сколько секунд будет доступно amount единиц."""
+        self._refill()
+        missing = amount - self.tokens
+        return max(missing / self.rate, 0.0) if self.rate else math.inf
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class AdmissionController:
+    """
+    Глобальный допуск дорогих запросов с учётом их стоимости.
+
+    Ограничивает и скорость (единиц в минуту), и суммарную стоимость
+    одновременно выполняющихся запросов. Не прошедшие сразу ждут в
+    ограниченной очереди.
+    """
+
+    def __init__(self, capacity: int, cost_per_minute: int, max_waiting: int):
+        self.capacity = capacity
+        self.in_use = 0
+        self.bucket = TokenBucket(cost_per_minute, cost_per_minute / 60)
+        self.max_waiting = max_waiting
+        self.waiting = 0
+        self._changed = asyncio.Condition()
+
+    def _clamp(self, cost: int) -> int:
+        # Запрос дороже всего лимита иначе не прошёл бы никогда
+        return min(cost, self.capacity, self.bucket.capacity)
+
+    def try_admit(self, cost: int) -> bool:
+        """Допускает запрос сразу, если есть ресурс и никто не стоит в очереди."""
+        cost = self._clamp(cost)
+        if self.waiting or self.in_use + cost > self.capacity:
+            return False
+        if not self.bucket.try_take(cost):
+            return False
+        self.in_use += cost
+        return True
+
+    def queue_full(self) -> bool:
+        return self.waiting >= self.max_waiting
+
+    async def wait_admit(self, cost: int, timeout: float) -> bool:
+        """Ждёт допуска не дольше timeout секунд."""
+        cost = self._clamp(cost)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        self.waiting += 1
+        try:
+            async with self._changed:
+                while True:
+                    if self.in_use + cost <= self.capacity and self.bucket.try_take(cost):
+                        self.in_use += cost
+                        return True
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        return False
+                    # Просыпаемся при освобождении ресурса или к пополнению корзины
+                    wake_in = min(remaining, max(self.bucket.time_until(cost), 0.05))
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), wake_in)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            self.waiting -= 1
+
+    async def release(self, cost: int):
+        """Освобождает ресурс выполненного запроса."""
+        self.in_use -= self._clamp(cost)
+        async with self._changed:
+            self._changed.notify_all()
+
+
+def get_expensive_command(event) -> str:
+    """Возвращает название дорогой команды из сообщения или нажатия кнопки."""
+    if isinstance(event, Message) and event.text and event.text.startswith("/"):
+        command = event.text.split()[0][1:].split("@")[0].lower()
+    elif isinstance(event, CallbackQuery) and event.data and event.data.startswith("action_"):
+        command = event.data.replace("action_", "")
+    else:
+        return None
+    return command if command in COMMAND_COSTS else None
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Ограничивает дорогие команды (/news, /report и их кнопки).
+
+    Сначала проверяется персональный лимит пользователя, затем глобальный
+    допуск. Лишние запросы либо ждут в очереди, либо отклоняются с
+    вежливым ответом.
+    """
+
+    def __init__(self):
+        self.user_buckets = {}
+        self.admission = AdmissionController(
+            GLOBAL_COST_CAPACITY, GLOBAL_COST_PER_MINUTE, ADMISSION_QUEUE_SIZE
+        )
+        self.stats = {
+            "admitted": 0,
+            "deferred": 0,
+            "rejected_user": 0,
+            "shed": 0,
+        }
+
+    def _user_bucket(self, user_id: int) -> TokenBucket:
+        bucket = self.user_buckets.get(user_id)
+        if bucket is None:
+            if len(self.user_buckets) >= MAX_TRACKED_USERS:
+                # Полная корзина ничем не отличается от новой — её можно забыть
+                self.user_buckets = {
+                    uid: b for uid, b in self.user_buckets.items() if not b.is_full()
+                }
+            bucket = TokenBucket(USER_COST_BURST, USER_COST_PER_MINUTE / 60)
+            self.user_buckets[user_id] = bucket
+        return bucket
+
+    async def __call__(self, handler, event, data):
+        command = get_expensive_command(event)
+        if command is None or event.from_user is None:
+            return await handler(event, data)
+
+        cost = COMMAND_COSTS[command]
+        user_id = event.from_user.id
+        bucket = self._user_bucket(user_id)
+
+        if not bucket.try_take(cost):
+            self.stats["rejected_user"] += 1
+            wait = math.ceil(bucket.time_until(cost))
+            logger.info(f"Лимит пользователя {user_id}: /{command} отклонён")
+            await self._reject(event, f"⏳ Слишком часто. Попробуйте через {wait} сек.")
+            return None
+
+        if not self.admission.try_admit(cost):
+            if self.admission.queue_full():
+                bucket.refund(cost)
+                self.stats["shed"] += 1
+                logger.warning(f"Очередь допуска заполнена: /{command} от {user_id} отклонён")
+                await self._reject(event, "😔 Бот сейчас перегружен. Попробуйте через пару минут.")
+                return None
+
+            self.stats["deferred"] += 1
+            logger.info(f"Запрос /{command} от {user_id} поставлен в очередь")
+            await self._notify(event, "⏳ Сейчас много запросов — ваш в очереди, ответ придёт чуть позже.")
+            if not await self.admission.wait_admit(cost, ADMISSION_TIMEOUT):
+                bucket.refund(cost)
+                self.stats["shed"] += 1
+                logger.warning(f"Не дождался допуска: /{command} от {user_id}")
+                # Обработчик не будет вызван, поэтому на callback отвечаем здесь
+                await self._reject(event, "😔 Бот сейчас перегружен. Попробуйте через пару минут.")
+                return None
+
+        self.stats["admitted"] += 1
+        try:
+            return await handler(event, data)
+        finally:
+            await self.admission.release(cost)
+
+    @staticmethod
+    async def _reject(event, text: str):
+        """Отвечает на отклонённый запрос (обработчик не будет вызван)."""
+        if isinstance(event, CallbackQuery):
+            await event.answer(text, show_alert=True)
+        else:
+            await event.answer(text)
+
+    @staticmethod
+    async def _notify(event, text: str):
+        """Пишет сообщение, не отвечая на callback — на него ответит обработчик."""
+        if isinstance(event, CallbackQuery):
+            await event.message.answer(text)
+        else:
+            await event.answer(text)
+
+    def get_stats(self) -> dict:
+        """Возвращает счётчики допущенных, отложенных и отклонённых запросов."""
+        return dict(
+            self.stats,
+            waiting=self.admission.waiting,
+            in_use=self.admission.in_use,
+        )
+
+    def log_stats(self):
+        """Пишет счётчики ограничения дорогих команд в лог."""
+        stats = self.get_stats()
+        logger.info(
+            f"Ограничение команд: допущено {stats['admitted']}, отложено {stats['deferred']}, "
+            f"отклонено по лимиту пользователя {stats['rejected_user']}, сброшено {stats['shed']}, "
+            f"ждут {stats['waiting']}, занято {stats['in_use']}"
+        )
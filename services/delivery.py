@@ -0,0 +1,139 @@
+from datetime import datetime
+import logging
+
+import pytz
+
+from config import DELIVERY_CATCHUP_MINUTES
+from .user_settings import load_all_settings, get_user_settings, next_delivery
+
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def epoch_minute(moment: datetime) -> int:
+    """Номер минуты от начала эпохи (UTC)."""
+    return int(moment.timestamp()) // 60
+
+
+class DeliveryWheel:
+    """
+    Минутное колесо доставки рассылки.
+
+    Сутки разбиты на 1440 корзин по минутам UTC. Каждый чат лежит в корзине
+    своего ближайшего момента рассылки, поэтому на каждом тике планировщика
+    достаточно забрать одну корзину, а не перебирать всех подписчиков.
+    """
+
+    def __init__(self):
+        self.buckets = [set() for _ in range(MINUTES_PER_DAY)]
+        # chat_id -> (минута от эпохи, локальная дата ближайшей рассылки)
+        self.slots = {}
+        # chat_id -> локальная дата последней отправленной рассылки
+        self.delivered = {}
+        self.last_tick = None
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def schedule(self, chat_id: int, now: datetime = None, settings: dict = None):
+        """Кладёт чат в корзину его ближайшей рассылки (или перекладывает)."""
+        if now is None:
+            now = datetime.now(pytz.utc)
+        if settings is None:
+            settings = get_user_settings(chat_id)
+
+        moment = next_delivery(settings, now)
+        # Не шлём второй отчёт за те же сутки, если время перенесли на более позднее
+        if self.delivered.get(chat_id) == moment.date():
+            moment = next_delivery(settings, moment)
+
+        self.unschedule(chat_id)
+        minute = epoch_minute(moment)
+        self.buckets[minute % MINUTES_PER_DAY].add(chat_id)
+        self.slots[chat_id] = (minute, moment.date())
+
+    def unschedule(self, chat_id: int):
+        """Убирает чат из колеса."""
+        slot = self.slots.pop(chat_id, None)
+        if slot is not None:
+            self.buckets[slot[0] % MINUTES_PER_DAY].discard(chat_id)
+
+    def remove(self, chat_id: int):
+        """Убирает отписавшийся чат из колеса и забывает его последнюю рассылку."""
+        self.unschedule(chat_id)
+        self.delivered.pop(chat_id, None)
+
+    def rebuild(self, chat_ids, now: datetime = None):
+        """
+        Пересобирает колесо целиком.
+
+        Нужно периодически: смещение часовых поясов меняется при переходе
+        на летнее/зимнее время, и корзина в UTC сдвигается.
+        Рассылки считаются от последнего обработанного тика, а не от now,
+        чтобы чаты, чья минута ещё не забрана pop_due, не уехали на завтра.
+        """
+        if now is None:
+            now = datetime.now(pytz.utc)
+        current = epoch_minute(now)
+        if self.last_tick is None:
+            # Бот мог стартовать посреди минуты рассылки, а первый тик pop_due
+            # придёт только в следующую минуту. Считаем предыдущую минуту
+            # обработанной, чтобы первый тик забрал и минуту старта
+            anchor = current - 1
+            self.last_tick = anchor
+        else:
+            anchor = max(min(self.last_tick, current), current - DELIVERY_CATCHUP_MINUTES)
+        after = datetime.fromtimestamp(anchor * 60, pytz.utc)
+        data = load_all_settings()
+
+        chat_ids = set(chat_ids)
+        self.buckets = [set() for _ in range(MINUTES_PER_DAY)]
+        self.slots = {}
+        self.delivered = {
+            chat_id: date for chat_id, date in self.delivered.items() if chat_id in chat_ids
+        }
+        for chat_id in chat_ids:
+            self.schedule(chat_id, after, get_user_settings(chat_id, data))
+        logger.info(f"Колесо доставки пересобрано: {len(self.slots)} чатов")
+
+    def pop_due(self, now: datetime = None) -> list:
+        """
+        Забирает чаты, которым пора отправить рассылку.
+
+        Обрабатывает все минуты с прошлого тика (но не больше
+        DELIVERY_CATCHUP_MINUTES), чтобы пропущенные тики не теряли корзины.
+        Отданные чаты сразу перекладываются на следующие сутки.
+
+        Returns:
+            list: списки chat_id по корзинам, в порядке времени
+        """
+        if now is None:
+            now = datetime.now(pytz.utc)
+        current = epoch_minute(now)
+        if self.last_tick is None or self.last_tick >= current:
+            start = current
+        else:
+            start = max(self.last_tick + 1, current - DELIVERY_CATCHUP_MINUTES + 1)
+        self.last_tick = current
+
+        batches = []
+        data = None
+        for minute in range(start, current + 1):
+            bucket = self.buckets[minute % MINUTES_PER_DAY]
+            if not bucket:
+                continue
+            if data is None:
+                data = load_all_settings()
+
+            batch = []
+            for chat_id in list(bucket):
+                due_minute, local_date = self.slots[chat_id]
+                if due_minute > minute:
+                    continue
+                self.delivered[chat_id] = local_date
+                batch.append(chat_id)
+                self.schedule(chat_id, now, get_user_settings(chat_id, data))
+            if batch:
+                batches.append(batch)
+        return batches
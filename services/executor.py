@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from config import CPU_POOL_KIND, CPU_POOL_WORKERS, CPU_POOL_QUEUE_SIZE, CPU_POOL_WAIT_WARNING
+from .profiling import span
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_slots = None
+_stats = {
+    "submitted": 0,
+    "completed": 0,
+    "failed": 0,
+    "waiting": 0,
+    "in_flight": 0,
+    "total_wait": 0.0,
+    "max_wait": 0.0,
+}
+
+
+def _timed_call(func, submitted_at: float, *args):
+    """Выполняется в воркере: возвращает время ожидания в очереди пула и результат."""
+    return time.time() - submitted_at, func(*args)
+
+
+def get_executor():
+    """Возвращает пул для CPU-задач (создаётся при первом обращении)."""
+    global _executor
+    if _executor is None:
+        if CPU_POOL_KIND == "process":
+            _executor = ProcessPoolExecutor(max_workers=CPU_POOL_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=CPU_POOL_WORKERS, thread_name_prefix="cpu")
+        logger.info(f"CPU-пул: {CPU_POOL_KIND}, воркеров {CPU_POOL_WORKERS}, очередь {CPU_POOL_QUEUE_SIZE}")
+    return _executor
+
+
+async def run_cpu(func, *args):
+    """
+    Выполняет CPU-тяжёлую функцию в пуле, не блокируя event loop.
+
+    Одновременно в пуле не больше CPU_POOL_WORKERS + CPU_POOL_QUEUE_SIZE задач;
+    остальные вызывающие ждут свободного места. Для пула процессов func
+    и аргументы должны сериализоваться через pickle.
+    """
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(CPU_POOL_WORKERS + CPU_POOL_QUEUE_SIZE)
+
+    with span(f"cpu:{func.__name__}"):
+        enqueued_at = time.monotonic()
+        _stats["waiting"] += 1
+        try:
+            await _slots.acquire()
+        finally:
+            _stats["waiting"] -= 1
+        admission_wait = time.monotonic() - enqueued_at
+
+        _stats["submitted"] += 1
+        _stats["in_flight"] += 1
+        try:
+            loop = asyncio.get_running_loop()
+            queue_wait, result = await loop.run_in_executor(
+                get_executor(), _timed_call, func, time.time(), *args
+            )
+        except Exception:
+            _stats["failed"] += 1
+            raise
+        finally:
+            _stats["in_flight"] -= 1
+            _slots.release()
+
+    wait = admission_wait + max(queue_wait, 0.0)
+    _stats["completed"] += 1
+    _stats["total_wait"] += wait
+    _stats["max_wait"] = max(_stats["max_wait"], wait)
+    if wait > CPU_POOL_WAIT_WARNING:
+        logger.warning(f"CPU-пул перегружен: {func.__name__} ждал {wait:.2f} с")
+    return result
+
+
+def get_pool_stats() -> dict:
+    """Возвращает метрики CPU-пула."""
+    stats = dict(_stats)
+    finished = stats["completed"]
+    stats["avg_wait"] = stats["total_wait"] / finished if finished else 0.0
+    return stats
+
+
+def log_pool_stats():
+    """Пишет метрики CPU-пула в лог."""
+    stats = get_pool_stats()
+    logger.info(
+        f"CPU-пул: выполнено {stats['completed']}, ошибок {stats['failed']}, "
+        f"в работе {stats['in_flight']}, ждут {stats['waiting']}, "
+        f"ожидание ср. {stats['avg_wait'] * 1000:.1f} мс / макс. {stats['max_wait'] * 1000:.1f} мс"
+    )
+
+
+def shutdown_pool():
+    """Останавливает CPU-пул."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
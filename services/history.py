@@ -0,0 +1,229 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+import logging
+import mmap
+import struct
+import time
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DIR = Path(__file__).parent.parent / "history"
+
+# Запись фиксированной ширины: (unix-время, значение), little-endian double
+RECORD = struct.Struct("<dd")
+
+DAY = 24 * 60 * 60
+WEEK = 7 * DAY
+
+ASSETS = {
+    "usd": "USD (ВТБ)",
+    "eur": "EUR (ВТБ)",
+    "cny": "CNY (ВТБ)",
+    "btc": "Bitcoin",
+    "eth": "Ethereum",
+    "usd_te": "Доллар (биржа)",
+    "brent": "Нефть Brent",
+    "urals": "Нефть Urals",
+    "gold": "Золото",
+    "silver": "Серебро",
+}
+
+# Время последней записи по активу, чтобы файл оставался отсортированным
+_last_written = {}
+
+
+def _history_file(asset: str) -> Path:
+    return HISTORY_DIR / f"{asset}.bin"
+
+
+def record_quote(asset: str, value: float, timestamp: float = None):
+    """Дописывает котировку в конец файла истории актива."""
+    if value is None:
+        return
+    if timestamp is None:
+        timestamp = time.time()
+
+    path = _history_file(asset)
+    if asset not in _last_written:
+        last = get_latest(asset)
+        _last_written[asset] = last[0] if last else 0.0
+    if timestamp <= _last_written[asset]:
+        return
+
+    HISTORY_DIR.mkdir(exist_ok=True)
+    with open(path, "ab") as f:
+        # Отрезаем недописанную запись, иначе сдвинутся все следующие
+        size = f.seek(0, 2)
+        if size % RECORD.size:
+            f.truncate(size - size % RECORD.size)
+        f.write(RECORD.pack(timestamp, float(value)))
+    _last_written[asset] = timestamp
+
+
+@contextmanager
+def _open_series(asset: str):
+    """
+    Открывает файл истории через mmap.
+
+    Отдаёт memoryview из double: чётные элементы — время, нечётные — значения.
+    Недописанная запись в конце файла (после сбоя) игнорируется.
+    """
+    path = _history_file(asset)
+    size = path.stat().st_size if path.exists() else 0
+    count = size // RECORD.size
+    if count == 0:
+        yield memoryview(b"").cast("d")
+        return
+
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        raw = memoryview(mm)[:count * RECORD.size]
+        view = raw.cast("d")
+        try:
+            yield view
+        finally:
+            view.release()
+            raw.release()
+            mm.close()
+
+
+def _bisect_right(view: memoryview, timestamp: float) -> int:
+    """Индекс первой записи со временем больше timestamp."""
+    lo, hi = 0, len(view) // 2
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if view[2 * mid] <= timestamp:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def get_series(asset: str, start: float, end: float) -> list:
+    """
+    Возвращает котировки актива за период.
+
+    Returns:
+        list: [(unix-время, значение), ...] в порядке времени
+    """
+    with _open_series(asset) as view:
+        first = _bisect_right(view, start - 1e-6)
+        last = _bisect_right(view, end)
+        return [(view[2 * i], view[2 * i + 1]) for i in range(first, last)]
+
+
+def get_value_at(asset: str, timestamp: float):
+    """
+    Возвращает последнюю котировку на момент timestamp.
+
+    Returns:
+        tuple: (unix-время, значение) или None
+    """
+    with _open_series(asset) as view:
+        index = _bisect_right(view, timestamp) - 1
+        if index < 0:
+            return None
+        return view[2 * index], view[2 * index + 1]
+
+
+def get_latest(asset: str):
+    """Возвращает последнюю сохранённую котировку актива или None."""
+    with _open_series(asset) as view:
+        if not len(view):
+            return None
+        return view[-2], view[-1]
+
+
+def get_change(asset: str, value: float, seconds: int, now: float = None):
+    """
+    Изменение value в процентах относительно котировки seconds секунд назад.
+
+    Котировка должна быть не старше половины периода от искомого момента,
+    иначе сравнение было бы с чем-то другим, чем «вчера» или «неделю назад».
+
+    Returns:
+        float: изменение в процентах или None, если данных нет
+    """
+    if now is None:
+        now = time.time()
+    target = now - seconds
+    past = get_value_at(asset, target)
+    if past is None or past[0] < target - seconds / 2 or not past[1]:
+        return None
+    return (value - past[1]) / past[1] * 100
+
+
+def format_change(change: float, label: str) -> str:
+    """Форматирует изменение в процентах со стрелкой: ▲0.4% д/д."""
+    arrow = "▲" if change > 0 else "▼" if change < 0 else "="
+    return f"{arrow}{abs(change):.1f}% {label}"
+
+
+def track_quote(asset: str, value: float) -> str:
+    """
+    Сохраняет котировку и возвращает изменения к вчера и к неделе для вывода.
+
+    Returns:
+        str: например " (▲0.4% д/д, ▼1.2% н/н)" или пустая строка
+    """
+    if value is None:
+        return ""
+
+    parts = []
+    try:
+        now = time.time()
+        for seconds, label in ((DAY, "д/д"), (WEEK, "н/н")):
+            change = get_change(asset, value, seconds, now)
+            if change is not None:
+                parts.append(format_change(change, label))
+        record_quote(asset, value, now)
+    except Exception as e:
+        logger.error(f"Ошибка истории котировок {asset}: {e}")
+
+    return f" ({', '.join(parts)})" if parts else ""
+
+
+def get_daily_closes(asset: str, days: int = 7, tz: str = "Europe/Moscow") -> list:
+    """
+    Возвращает последнюю котировку каждого дня за последние days дней.
+
+    Returns:
+        list: [(дата, значение), ...], дни без данных пропускаются
+    """
+    zone = pytz.timezone(tz)
+    today = datetime.now(zone).date()
+    result = []
+    with _open_series(asset) as view:
+        for offset in range(days - 1, -1, -1):
+            day = today - timedelta(days=offset)
+            start = zone.localize(datetime(day.year, day.month, day.day)).timestamp()
+            end = start + DAY
+            index = _bisect_right(view, end) - 1
+            if index >= 0 and view[2 * index] >= start:
+                result.append((day, view[2 * index + 1]))
+    return result
+
+
+def format_history(asset: str, days: int = 7) -> str:
+    """Формирует текст ответа на /history для актива."""
+    name = ASSETS[asset]
+    closes = get_daily_closes(asset, days)
+    if not closes:
+        return f"📈 {name}: истории пока нет — она копится с каждой сводкой."
+
+    lines = [f"📈 {name} за {days} дн.:"]
+    previous = None
+    for day, value in closes:
+        line = f"  {day.strftime('%d.%m')}: {value:,.2f}"
+        if previous:
+            line += f"  {format_change((value - previous) / previous * 100, '')}".rstrip()
+        lines.append(line)
+        previous = value
+
+    first, last = closes[0][1], closes[-1][1]
+    if len(closes) > 1 and first:
+        lines.append(f"\nЗа период: {format_change((last - first) / first * 100, '')}".rstrip())
+    return "\n".join(lines)
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import random
+import time
+
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, RateLimitError
+
+from config import (
+    DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL, DEEPSEEK_MODEL, DEEPSEEK_TIMEOUT,
+    DEEPSEEK_CONCURRENCY, DEEPSEEK_MAX_QUEUE,
+    DEEPSEEK_MAX_RETRIES, DEEPSEEK_BACKOFF_BASE, DEEPSEEK_BACKOFF_MAX
+)
+from .profiling import span
+
+logger = logging.getLogger(__name__)
+
+
+class LLMQueueFull(Exception):
+    """Очередь запросов к DeepSeek переполнена."""
+
+
+_client = None
+_slots = None
+_stats = {
+    "requests": 0,
+    "failed": 0,
+    "retries": 0,
+    "rejected": 0,
+    "waiting": 0,
+    "prompt_tokens": 0,
+    "completion_tokens": 0,
+    "total_latency": 0.0,
+}
+
+
+def get_client() -> AsyncOpenAI:
+    """Возвращает общий асинхронный клиент DeepSeek."""
+    global _client
+    if _client is None:
+        # Повторы делаем сами, с учётом общей очереди
+        _client = AsyncOpenAI(
+            api_key=DEEPSEEK_API_KEY,
+            base_url=DEEPSEEK_BASE_URL,
+            timeout=DEEPSEEK_TIMEOUT,
+            max_retries=0
+        )
+    return _client
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (APIConnectionError, RateLimitError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+
+def _backoff(attempt: int, error: Exception) -> float:
+    """Пауза перед повтором: Retry-After, если сервер его прислал, иначе full jitter."""
+    if isinstance(error, APIStatusError):
+        retry_after = error.response.headers.get("retry-after")
+        try:
+            return min(float(retry_after), DEEPSEEK_BACKOFF_MAX)
+        except (TypeError, ValueError):
+            pass
+    return random.uniform(0, min(DEEPSEEK_BACKOFF_MAX, DEEPSEEK_BACKOFF_BASE * 2 ** attempt))
+
+
+async def complete(messages: list, temperature: float = 0.6) -> str:
+    """
+    Отправляет запрос в DeepSeek и возвращает текст ответа.
+
+    Одновременно выполняется не больше DEEPSEEK_CONCURRENCY запросов,
+    ждать может не больше DEEPSEEK_MAX_QUEUE. При 429/5xx и сетевых
+    ошибках запрос повторяется с экспоненциальной паузой.
+
+    Raises:
+        LLMQueueFull: очередь переполнена
+    """
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(DEEPSEEK_CONCURRENCY)
+
+    if _stats["waiting"] >= DEEPSEEK_MAX_QUEUE:
+        _stats["rejected"] += 1
+        raise LLMQueueFull(f"В очереди DeepSeek уже {_stats['waiting']} запросов")
+
+    _stats["waiting"] += 1
+    try:
+        with span("deepseek:queue"):
+            await _slots.acquire()
+    finally:
+        _stats["waiting"] -= 1
+
+    try:
+        for attempt in range(DEEPSEEK_MAX_RETRIES + 1):
+            started = time.monotonic()
+            try:
+                with span("deepseek:request"):
+                    response = await get_client().chat.completions.create(
+                        model=DEEPSEEK_MODEL,
+                        messages=messages,
+                        temperature=temperature
+                    )
+            except Exception as e:
+                if not _is_retryable(e) or attempt == DEEPSEEK_MAX_RETRIES:
+                    _stats["failed"] += 1
+                    raise
+                delay = _backoff(attempt, e)
+                _stats["retries"] += 1
+                logger.warning(f"DeepSeek: {type(e).__name__}, повтор через {delay:.1f} с")
+                await asyncio.sleep(delay)
+                continue
+
+            latency = time.monotonic() - started
+            _stats["requests"] += 1
+            _stats["total_latency"] += latency
+            usage = response.usage
+            if usage:
+                _stats["prompt_tokens"] += usage.prompt_tokens
+                _stats["completion_tokens"] += usage.completion_tokens
+            logger.info(
+                f"DeepSeek: {latency:.1f} с, токенов "
+                f"{usage.prompt_tokens if usage else '?'} + {usage.completion_tokens if usage else '?'}"
+            )
+            return response.choices[0].message.content.strip()
+    finally:
+        _slots.release()
+
+
+def get_llm_stats() -> dict:
+    """Возвращает счётчики запросов, токенов и задержек DeepSeek."""
+    stats = dict(_stats)
+    stats["avg_latency"] = stats["total_latency"] / stats["requests"] if stats["requests"] else 0.0
+    return stats
+
+
+def log_llm_stats():
+    """Пишет метрики DeepSeek в лог."""
+    stats = get_llm_stats()
+    logger.info(
+        f"DeepSeek: запросов {stats['requests']}, ошибок {stats['failed']}, "
+        f"повторов {stats['retries']}, отклонено {stats['rejected']}, "
+        f"токенов {stats['prompt_tokens']} + {stats['completion_tokens']}, "
+        f"задержка ср. {stats['avg_latency']:.1f} с"
+    )
@@ -1,51 +1,110 @@
+import asyncio
+import time
 import requests
 from bs4 import BeautifulSoup
-from openai import OpenAI
 import logging
 
-from config import DEEPSEEK_API_KEY
+from config import DEEPSEEK_API_KEY, PREFETCH_MAX_INTERVAL
+from .executor import run_cpu
+from .llm import complete
+from .profiling import traced
+from .singleflight import single_flight
 from .user_sources import get_user_sources, get_channel_url, DEFAULT_SOURCES
 
 logger = logging.getLogger(__name__)
 
+# Последние посты каналов: channel -> (время загрузки, посты).
+# Наполняется фоновым опросом (services/prefetch.py) и запросами по требованию
+_post_store = {}
+# Старше этого посты из хранилища не отдаём — значит, фоновый опрос не успевает
+POST_STORE_MAX_AGE = PREFETCH_MAX_INTERVAL * 2
 
-def parse_single_channel(channel: str, limit: int = 5) -> list:
-    """Парсит новости из одного Telegram канала."""
-    url = get_channel_url(channel)
+
+def fetch_channel_html(url: str) -> str:
+    """Скачивает веб-версию Telegram канала."""
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+        'Accept-Charset': 'utf-8'
+    }
+    response = requests.get(url, headers=headers, timeout=15)
+    return response.content.decode('utf-8', errors='ignore')
+
+
+def extract_channel_posts(html: str, channel: str, limit: int = 5) -> list:
+    """Достаёт тексты последних постов из HTML канала (выполняется в CPU-пуле)."""
+    soup = BeautifulSoup(html, 'html.parser')
     
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Accept-Charset': 'utf-8'
-        }
-        response = requests.get(url, headers=headers, timeout=15)
-        response.encoding = 'utf-8'
-        soup = BeautifulSoup(response.content.decode('utf-8', errors='ignore'), 'html.parser')
-        
-        posts = soup.find_all('div', class_='tgme_widget_message_text js-message_text')
+    posts = soup.find_all('div', class_='tgme_widget_message_text js-message_text')
+    
+    news_list = []
+    for post in posts[-limit:]:
+        message = post.find_parent('div', class_='tgme_widget_message')
+        post_id = message.get('data-post') if message else None
         
-        news_list = []
-        for post in posts[-limit:]:
-            for tag in post.find_all(['br', 'tg-emoji', 'a', 'i', 'b']):
-                if tag.name == 'br':
-                    tag.replace_with(' ')
-                elif tag.name == 'tg-emoji':
-                    tag.decompose()
-            
-            text = post.get_text(strip=True)
-            text = text.encode('utf-8', errors='ignore').decode('utf-8')
-            if text and len(text) > 20:
-                news_list.append({"channel": channel, "text": text})
+        for tag in post.find_all(['br', 'tg-emoji', 'a', 'i', 'b']):
+            if tag.name == 'br':
+                tag.replace_with(' ')
+            elif tag.name == 'tg-emoji':
+                tag.decompose()
         
-        return news_list
+        text = post.get_text(strip=True)
+        text = text.encode('utf-8', errors='ignore').decode('utf-8')
+        if text and len(text) > 20:
+            news_list.append({"channel": channel, "id": post_id or text[:64], "text": text})
+    
+    return news_list
+
+
+def store_channel_posts(channel: str, posts: list):
+    """Сохраняет свежие посты канала в хранилище."""
+    _post_store[channel] = (time.time(), posts)
+
+
+def get_stored_posts(channel: str, max_age: float = POST_STORE_MAX_AGE):
+    """
+    Возвращает посты канала из хранилища.
+    
+    Returns:
+        list: посты или None, если их нет или они устарели
+    """
+    stored = _post_store.get(channel)
+    if stored is None or time.time() - stored[0] > max_age:
+        return None
+    return stored[1]
+
+
+async def fetch_channel_posts(channel: str, limit: int = 5) -> list:
+    """Скачивает и разбирает посты канала, сохраняя их в хранилище. Бросает исключения."""
+    url = get_channel_url(channel)
+    html = await traced(f"t.me:{channel}", asyncio.to_thread(fetch_channel_html, url))
+    posts = await run_cpu(extract_channel_posts, html, channel, limit)
+    store_channel_posts(channel, posts)
+    return posts
+
+
+async def parse_single_channel(channel: str, limit: int = 5) -> list:
+    """Парсит новости из одного Telegram канала."""
+    try:
+        return await fetch_channel_posts(channel, limit)
     except Exception as e:
         logger.error(f"Ошибка парсинга @{channel}: {e}")
         return []
 
 
-def parse_news(channels: list = None, limit_per_channel: int = 5) -> list:
+async def get_channel_news(channel: str, limit: int = 5) -> list:
+    """Берёт посты канала из хранилища, а если их там нет — парсит канал."""
+    stored = get_stored_posts(channel)
+    if stored is not None:
+        return stored[-limit:]
+    return await parse_single_channel(channel, limit)
+
+
+async def parse_news(channels: list = None, limit_per_channel: int = 5) -> list:
     """
-    Парсит новости из нескольких Telegram каналов.
+    Собирает новости из нескольких Telegram каналов.
+    
+    Посты берутся из хранилища фонового опроса; на t.me идём только
+    за каналами, которых там ещё нет.
     
     Args:
         channels: список названий каналов
@@ -57,9 +116,12 @@ def parse_news(channels: list = None, limit_per_channel: int = 5) -> list:
     if channels is None:
         channels = DEFAULT_SOURCES
     
+    results = await asyncio.gather(*[
+        get_channel_news(channel, limit_per_channel) for channel in channels
+    ])
+    
     all_news = []
-    for channel in channels:
-        news = parse_single_channel(channel, limit_per_channel)
+    for channel, news in zip(channels, results):
         all_news.extend(news)
         logger.info(f"@{channel}: {len(news)} новостей")
     
@@ -67,7 +129,7 @@ def parse_news(channels: list = None, limit_per_channel: int = 5) -> list:
     return all_news
 
 
-def summarize_news(news_list: list) -> str:
+async def summarize_news(news_list: list) -> str:
     """Суммаризирует новости через DeepSeek API."""
     if not news_list:
         return "Новости недоступны"
@@ -85,13 +147,7 @@ def summarize_news(news_list: list) -> str:
     logger.info(f"Отправляю {len(news_list)} новостей в DeepSeek")
     
     try:
-        client = OpenAI(
-            api_key=DEEPSEEK_API_KEY,
-            base_url="https://api.deepseek.com"
-        )
-        
-        response = client.chat.completions.create(
-            model="deepseek-chat",
+        summary = await complete(
             messages=[
                 {
                     "role": "system",
@@ -106,13 +162,13 @@ def summarize_news(news_list: list) -> str:
         )
         
         logger.info("Сводка получена успешно")
-        return response.choices[0].message.content.strip()
+        return summary
     except Exception as e:
         logger.error(f"Ошибка DeepSeek API: {e}")
         return "Ошибка получения сводки новостей"
 
 
-def get_news_summary(user_id: int = None) -> str:
+async def get_news_summary(user_id: int = None) -> str:
     """
     Получает и суммаризирует новости для пользователя.
     
@@ -124,5 +180,12 @@ def get_news_summary(user_id: int = None) -> str:
     else:
         channels = DEFAULT_SOURCES
     
-    news = parse_news(channels)
-    return summarize_news(news)
+    # Пользователи с одинаковым набором каналов получают одну общую сводку
+    key = ("news", tuple(sorted(channels)))
+    return await single_flight(key, lambda: _summarize_channels(channels))
+
+
+async def _summarize_channels(channels: list) -> str:
+    """Парсит каналы и суммаризирует собранные новости."""
+    news = await parse_news(channels)
+    return await summarize_news(news)
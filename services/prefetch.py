@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import time
+
+from config import (
+    PREFETCH_TICK, PREFETCH_MIN_INTERVAL, PREFETCH_MAX_INTERVAL,
+    PREFETCH_TARGET_NEW_POSTS, PREFETCH_BUDGET_PER_MINUTE
+)
+from .news import fetch_channel_posts
+from .user_sources import load_all_sources, DEFAULT_SOURCES
+
+logger = logging.getLogger(__name__)
+
+# Вес нового наблюдения в скользящей оценке частоты постов
+RATE_SMOOTHING = 0.3
+
+# channel -> состояние опроса канала
+_schedule = {}
+
+
+def get_subscribed_channels() -> set:
+    """Возвращает объединение каналов всех пользователей."""
+    channels = set(DEFAULT_SOURCES)
+    for sources in load_all_sources().values():
+        channels.update(sources)
+    return channels
+
+
+def _clamp_interval(interval: float) -> float:
+    return min(max(interval, PREFETCH_MIN_INTERVAL), PREFETCH_MAX_INTERVAL)
+
+
+def _adapt_interval(state: dict, new_posts: int, now: float):
+    """
+    Пересчитывает интервал опроса по наблюдаемой частоте постов.
+
+    Частота сглаживается экспоненциально; интервал подбирается так, чтобы
+    между опросами в среднем появлялось PREFETCH_TARGET_NEW_POSTS постов.
+    """
+    elapsed = max(now - state["last_poll"], 1.0)
+    observed = new_posts / elapsed
+    if state["rate"] is None:
+        state["rate"] = observed
+    else:
+        state["rate"] = RATE_SMOOTHING * observed + (1 - RATE_SMOOTHING) * state["rate"]
+
+    if state["rate"] > 0:
+        state["interval"] = _clamp_interval(PREFETCH_TARGET_NEW_POSTS / state["rate"])
+    else:
+        state["interval"] = PREFETCH_MAX_INTERVAL
+
+
+async def _poll_channel(channel: str, state: dict, now: float):
+    """Опрашивает один канал и планирует следующий опрос."""
+    try:
+        posts = await fetch_channel_posts(channel)
+    except Exception as e:
+        logger.warning(f"Фоновый опрос @{channel} не удался: {e}")
+        state["interval"] = _clamp_interval(state["interval"] * 2)
+        state["next_poll"] = now + state["interval"]
+        return
+
+    ids = {post["id"] for post in posts}
+    if state["seen"] is not None:
+        _adapt_interval(state, len(ids - state["seen"]), now)
+    state["seen"] = ids
+    state["last_poll"] = now
+    state["next_poll"] = now + state["interval"]
+
+
+async def poll_channels():
+    """
+    Тик фонового опроса: обновляет каналы, у которых подошёл срок.
+
+    За тик опрашивается не больше доли глобального бюджета
+    PREFETCH_BUDGET_PER_MINUTE; сначала — самые просроченные каналы.
+    """
+    now = time.time()
+    channels = get_subscribed_channels()
+
+    for channel in set(_schedule) - channels:
+        del _schedule[channel]
+    for channel in channels:
+        _schedule.setdefault(channel, {
+            "interval": PREFETCH_MIN_INTERVAL,
+            "next_poll": now,
+            "last_poll": now,
+            "seen": None,
+            "rate": None,
+        })
+
+    due = sorted(
+        [channel for channel, state in _schedule.items() if state["next_poll"] <= now],
+        key=lambda channel: _schedule[channel]["next_poll"]
+    )
+    budget = max(1, int(PREFETCH_BUDGET_PER_MINUTE * PREFETCH_TICK / 60))
+    if len(due) > budget:
+        logger.info(f"Фоновый опрос: {len(due) - budget} каналов отложено до следующего тика")
+
+    await asyncio.gather(*[
+        _poll_channel(channel, _schedule[channel], now) for channel in due[:budget]
+    ])
+
+
+def get_prefetch_stats() -> dict:
+    """Возвращает текущие интервалы опроса каналов (сек)."""
+    return {channel: round(state["interval"]) for channel, state in _schedule.items()}
@@ -0,0 +1,197 @@
+from collections import defaultdict
+from contextlib import asynccontextmanager, nullcontext
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+import cProfile
+import io
+import logging
+import pstats
+import time
+
+logger = logging.getLogger(__name__)
+
+PROFILES_DIR = Path(__file__).parent.parent / "profiles"
+TOP_N = 15
+
+# Активная сессия профилирования и стек вложенных замеров текущей задачи.
+# Дочерние задачи (gather, single_flight) наследуют их при создании
+_session = ContextVar("profile_session", default=None)
+_stack = ContextVar("profile_stack", default=())
+
+# Заглушка для выключенного профилирования: никаких замеров и аллокаций
+_DISABLED = nullcontext()
+
+
+# Функции цикла событий, которые cProfile видит в каждой итерации loop
+_EVENT_LOOP_FILES = ("/asyncio/", "/selectors.py")
+_EVENT_LOOP_BUILTINS = ("select.", "_contextvars.Context", "_asyncio.")
+
+
+def _is_event_loop(key: tuple) -> bool:
+    """Относится ли запись pstats (файл, строка, функция) к самому циклу событий."""
+    filename, _, function = key
+    if filename == "~":
+        return any(name in function for name in _EVENT_LOOP_BUILTINS)
+    return any(part in filename.replace("\\", "/") for part in _EVENT_LOOP_FILES)
+
+
+class ProfilerBusy(Exception):
+    """Профилирование уже идёт."""
+
+
+class ProfileSession:
+    """Результаты одного профилируемого запуска: cProfile и замеры вызовов сервисов."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.profiler = cProfile.Profile()
+        # "a;b;c" -> (суммарное время, число вызовов)
+        self.spans = defaultdict(lambda: [0.0, 0])
+        self.elapsed = 0.0
+        self.files = []
+        self.summary = ""
+
+    def record(self, path: tuple, duration: float):
+        span = self.spans[";".join(path)]
+        span[0] += duration
+        span[1] += 1
+
+    def folded_stacks(self) -> list:
+        """
+        Замеры в формате collapsed stacks (flamegraph.pl, speedscope).
+
+        Для каждого стека пишется собственное время в микросекундах —
+        полное время минус время вложенных вызовов.
+        """
+        children = defaultdict(float)
+        for path, (total, _) in self.spans.items():
+            if ";" in path:
+                children[path.rsplit(";", 1)[0]] += total
+        lines = []
+        for path, (total, _) in sorted(self.spans.items()):
+            # Вложенные вызовы могли идти параллельно и в сумме превысить родителя
+            own = max(total - children[path], 0.0)
+            lines.append(f"{path} {int(own * 1_000_000)}")
+        return lines
+
+    def top_functions(self) -> str:
+        """
+        Top-N функций cProfile по собственному времени.
+
+        cProfile включён на весь event loop, поэтому сюда попадают все задачи,
+        работавшие во время замера, а не только профилируемый обработчик.
+        Сам цикл событий (asyncio, selectors, ожидание в epoll) отброшен —
+        иначе он занимает верх таблицы временем простоя.
+        """
+        out = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=out)
+        for key in [key for key in stats.stats if _is_event_loop(key)]:
+            del stats.stats[key]
+        stats.strip_dirs().sort_stats("tottime").print_stats(TOP_N)
+        lines = [line for line in out.getvalue().splitlines() if line.strip()]
+        # Пропускаем шапку pstats до таблицы
+        for index, line in enumerate(lines):
+            if line.lstrip().startswith("ncalls"):
+                return "\n".join(lines[index:])
+        return "\n".join(lines)
+
+    def save(self):
+        """Пишет дамп cProfile (.prof) и collapsed stacks (.folded)."""
+        PROFILES_DIR.mkdir(exist_ok=True)
+        stem = PROFILES_DIR / f"{self.name}_{datetime.now():%Y%m%d_%H%M%S}"
+        prof_path = stem.with_suffix(".prof")
+        folded_path = stem.with_suffix(".folded")
+        self.profiler.dump_stats(prof_path)
+        folded_path.write_text("\n".join(self.folded_stacks()) + "\n", encoding="utf-8")
+        self.files = [prof_path, folded_path]
+
+    def build_summary(self) -> str:
+        lines = [f"⏱ Профиль «{self.name}»: {self.elapsed:.2f} с", "", "Вызовы сервисов (всего, раз):"]
+        # Сортировка по пути даёт дерево: вложенные вызовы идут под родителем
+        for path, (total, count) in sorted(self.spans.items())[:TOP_N * 2]:
+            depth = path.count(";")
+            lines.append(f"{'  ' * depth}{path.rsplit(';', 1)[-1]}: {total * 1000:.0f} мс ×{count}")
+        lines += [
+            "",
+            f"Top-{TOP_N} функций (cProfile, собственное время всех задач event loop за время замера):",
+            self.top_functions()
+        ]
+        return "\n".join(lines)
+
+
+class _Span:
+    __slots__ = ("session", "name", "token", "started")
+
+    def __init__(self, session: ProfileSession, name: str):
+        self.session = session
+        self.name = name
+
+    def __enter__(self):
+        self.token = _stack.set(_stack.get() + (self.name,))
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.session.record(_stack.get(), time.perf_counter() - self.started)
+        _stack.reset(self.token)
+        return False
+
+
+def span(name: str):
+    """
+    Замер участка кода для активной сессии профилирования.
+
+    Без активной сессии возвращает пустой контекстный менеджер.
+    """
+    session = _session.get()
+    if session is None:
+        return _DISABLED
+    return _Span(session, name)
+
+
+async def traced(name: str, awaitable):
+    """Ждёт awaitable внутри замера name (удобно для asyncio.gather)."""
+    with span(name):
+        return await awaitable
+
+
+_active = None
+
+
+@asynccontextmanager
+async def profile_run(name: str):
+    """
+    Профилирует блок кода: cProfile на время блока и замеры span().
+
+    После выхода из блока дампы записаны в profiles/, а сводка
+    доступна в session.summary.
+
+    Raises:
+        ProfilerBusy: другой запуск уже профилируется
+    """
+    global _active
+    if _active is not None:
+        raise ProfilerBusy(f"Уже идёт профилирование «{_active.name}»")
+
+    session = ProfileSession(name)
+    _active = session
+    session_token = _session.set(session)
+    stack_token = _stack.set((name,))
+    started = time.perf_counter()
+    session.profiler.enable()
+    try:
+        yield session
+    finally:
+        session.profiler.disable()
+        session.elapsed = time.perf_counter() - started
+        session.record((name,), session.elapsed)
+        _stack.reset(stack_token)
+        _session.reset(session_token)
+        _active = None
+        try:
+            session.save()
+            session.summary = session.build_summary()
+        except Exception as e:
+            logger.error(f"Ошибка сохранения профиля {name}: {e}")
+        logger.info(f"Профиль «{name}» записан: {', '.join(str(p) for p in session.files)}")
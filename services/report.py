@@ -1,80 +1,160 @@
 from datetime import datetime
+import asyncio
+import math
+import time
 import pytz
 import logging
 
+from config import REPORT_SECTION_TTL, REPORT_SECTION_RETRY
 from .currency import get_currency
 from .crypto import get_bitcoin_rate, get_ethereum_rate
 from .weather import get_weather, get_temperatures
 from .commodities import get_all_commodities
+from .executor import run_cpu
+from .history import track_quote
+from .profiling import span, traced
+from .singleflight import single_flight
 
 logger = logging.getLogger(__name__)
 
 
-def generate_report() -> str:
-    """Формирует полную сводку для отправки в Telegram."""
-    
+def get_report_date() -> str:
+    """Текущая дата по Москве для заголовков сводки."""
     moscow_tz = pytz.timezone('Europe/Moscow')
-    now = datetime.now(moscow_tz)
-    date_str = now.strftime("%d.%m.%Y")
-    
-    lines = [f"📊 *Сводка на {date_str}*\n"]
+    return datetime.now(moscow_tz).strftime("%d.%m.%Y")
+
+
+async def render_currency() -> tuple:
+    """Строки раздела курсов валют и признак того, что все курсы получены."""
+    lines = []
+    usd_rate, eur_rate, cny_rate = await asyncio.gather(
+        traced("vtb:USD", asyncio.to_thread(get_currency, 'RUB', 'USD')),
+        traced("vtb:EUR", asyncio.to_thread(get_currency, 'RUB', 'EUR')),
+        traced("vtb:CNY", asyncio.to_thread(get_currency, 'RUB', 'CNY')),
+    )
+    if usd_rate:
+        lines.append(f"  USD: {usd_rate} ₽{track_quote('usd', usd_rate)}")
+    if eur_rate:
+        lines.append(f"  EUR: {eur_rate} ₽{track_quote('eur', eur_rate)}")
+    if cny_rate:
+        lines.append(f"  CNY: {cny_rate / 10} ₽{track_quote('cny', cny_rate / 10)}")
+    return lines, all([usd_rate, eur_rate, cny_rate])
+
+
+async def render_crypto() -> tuple:
+    """Строки раздела криптовалют и признак того, что все курсы получены."""
+    lines = []
+    btc_rate, eth_rate = await asyncio.gather(
+        traced("coingecko:bitcoin", asyncio.to_thread(get_bitcoin_rate)),
+        traced("coingecko:ethereum", asyncio.to_thread(get_ethereum_rate)),
+    )
+    if btc_rate:
+        lines.append(f"  Bitcoin: ${btc_rate:,.0f}{track_quote('btc', btc_rate)}")
+    if eth_rate:
+        lines.append(f"  Ethereum: ${eth_rate:,.0f}{track_quote('eth', eth_rate)}")
+    return lines, all([btc_rate, eth_rate])
+
+
+async def render_commodities() -> tuple:
+    """Строки раздела биржевых котировок и признак того, что все котировки получены."""
+    lines = []
+    commodities = await get_all_commodities()
+    commodity_names = {"usd": "Доллар", "brent": "Нефть Brent", "urals": "Нефть Urals", "gold": "Золото", "silver": "Серебро"}
+    # Биржевой доллар хранится отдельно от курса ВТБ
+    history_keys = {"usd": "usd_te"}
+    for key in ["usd", "brent", "urals", "gold", "silver"]:
+        value = commodities.get(key)
+        if value:
+            unit = "₽" if key == "usd" else "$"
+            changes = track_quote(history_keys.get(key, key), value)
+            lines.append(f"  {commodity_names[key]}: {value} {unit}{changes}")
+    return lines, len(lines) == len(commodity_names)
+
+
+async def render_weather() -> tuple:
+    """Строки раздела погоды и признак того, что есть температура на все часы."""
+    lines = []
+    hours = [9, 12, 15, 18, 21]
+    weather_df = await traced("meteostat", asyncio.to_thread(get_weather))
+    if weather_df is not None and not weather_df.empty:
+        temps = await run_cpu(get_temperatures, weather_df, hours)
+        for hour, temp in temps.items():
+            if temp is not None and not math.isnan(temp):
+                lines.append(f"  {hour:02d}:00: {temp:+.1f}°C")
+    return lines, len(lines) == len(hours)
+
+
+# Разделы сводки в порядке вывода: заголовок и функция, возвращающая
+# строки и признак полноты данных
+SECTIONS = {
+    "currency": ("💱 *Курсы валют (ВТБ):*", render_currency),
+    "crypto": ("₿ *Крипта:*", render_crypto),
+    "commodities": ("🏦 *Биржевые котировки:*", render_commodities),
+    "weather": ("🌤 *Погода в Москве ({date}):*", render_weather),
+}
+
+# name -> (время готовности, дата, срок жизни, готовый Markdown-фрагмент)
+_fragments = {}
+
+
+def _is_fresh(name: str, date_str: str) -> bool:
+    cached = _fragments.get(name)
+    if cached is None:
+        return False
+    rendered_at, rendered_date, ttl, _ = cached
+    return rendered_date == date_str and time.monotonic() - rendered_at < ttl
+
+
+async def _render_section(name: str) -> str:
+    """Опрашивает источники раздела и кладёт готовый фрагмент в кэш."""
+    title, render = SECTIONS[name]
+    date_str = get_report_date()
+    title = title.format(date=date_str)
+    ttl = REPORT_SECTION_TTL[name]
     
-    # Валюты
     try:
-        lines.append("💱 *Курсы валют (ВТБ):*")
-        usd_rate = get_currency('RUB', 'USD')
-        eur_rate = get_currency('RUB', 'EUR')
-        cny_rate = get_currency('RUB', 'CNY')
-        if usd_rate:
-            lines.append(f"  USD: {usd_rate} ₽")
-        if eur_rate:
-            lines.append(f"  EUR: {eur_rate} ₽")
-        if cny_rate:
-            lines.append(f"  CNY: {cny_rate / 10} ₽")
+        with span(f"section:{name}"):
+            lines, complete = await render()
     except Exception as e:
-        logger.error(f"Ошибка в блоке валют: {e}")
-        lines.append("  Данные недоступны")
+        logger.error(f"Ошибка в разделе {name}: {e}")
+        lines, complete = [], False
     
-    # Крипта
-    try:
-        lines.append("\n₿ *Крипта:*")
-        btc_rate = get_bitcoin_rate()
-        eth_rate = get_ethereum_rate()
-        if btc_rate:
-            lines.append(f"  Bitcoin: ${btc_rate:,.0f}")
-        if eth_rate:
-            lines.append(f"  Ethereum: ${eth_rate:,.0f}")
-    except Exception as e:
-        logger.error(f"Ошибка в блоке крипты: {e}")
-        lines.append("  Данные недоступны")
+    # Источники обычно не бросают исключения, а возвращают None, поэтому
+    # неполный раздел тоже хранится недолго и скоро запрашивается заново
+    if not complete:
+        logger.warning(f"Раздел {name} собран не полностью, повтор через {REPORT_SECTION_RETRY} с")
+        ttl = min(ttl, REPORT_SECTION_RETRY)
+    if not lines:
+        lines = ["  Данные недоступны"]
     
-    # Сырье
-    try:
-        lines.append("\n🏦 *Биржевые котировки:*")
-        commodities = get_all_commodities()
-        commodity_names = {"usd": "Доллар", "brent": "Нефть Brent", "urals": "Нефть Urals", "gold": "Золото", "silver": "Серебро"}
-        for key in ["usd", "brent", "urals", "gold", "silver"]:
-            value = commodities.get(key)
-            if value:
-                unit = "₽" if key == "usd" else "$"
-                lines.append(f"  {commodity_names[key]}: {value} {unit}")
-    except Exception as e:
-        logger.error(f"Ошибка в блоке котировок: {e}")
-        lines.append("  Данные недоступны")
+    fragment = "\n".join([title, *lines])
+    _fragments[name] = (time.monotonic(), date_str, ttl, fragment)
+    return fragment
+
+
+async def refresh_section(name: str) -> str:
+    """Принудительно обновляет раздел (для фонового обновления по расписанию)."""
+    return await single_flight(("report_section", name), lambda: _render_section(name))
+
+
+async def get_section(name: str) -> str:
+    """Возвращает фрагмент раздела, обновляя его, только если он устарел."""
+    if _is_fresh(name, get_report_date()):
+        return _fragments[name][3]
+    return await refresh_section(name)
+
+
+async def generate_report(force: bool = False) -> str:
+    """
+    Формирует полную сводку для отправки в Telegram.
     
-    # Погода
-    try:
-        lines.append(f"\n🌤 *Погода в Москве ({date_str}):*")
-        weather_df = get_weather()
-        if weather_df is not None and not weather_df.empty:
-            temps = get_temperatures(weather_df, [9, 12, 15, 18, 21])
-            for hour, temp in temps.items():
-                if temp is not None:
-                    lines.append(f"  {hour:02d}:00: {temp:+.1f}°C")
-        else:
-            lines.append("  Данные недоступны")
-    except Exception as e:
-        logger.error(f"Ошибка в блоке погоды: {e}")
-        lines.append("  Данные недоступны")
+    Сводка склеивается из готовых фрагментов разделов; к источникам
+    обращаются только разделы, у которых истёк срок жизни.
     
-    return "\n".join(lines)
+    Args:
+        force: обновить все разделы, не глядя на кэш (для профилирования)
+    """
+    date_str = get_report_date()
+    get_fragment = refresh_section if force else get_section
+    fragments = await asyncio.gather(*[get_fragment(name) for name in SECTIONS])
+    return "\n\n".join([f"📊 *Сводка на {date_str}*", *fragments])
@@ -0,0 +1,45 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+_in_flight = {}
+_stats = {"started": 0, "coalesced": 0}
+
+
+def _forget(key, task: asyncio.Task):
+    """Убирает завершённую задачу из списка выполняющихся."""
+    if _in_flight.get(key) is task:
+        del _in_flight[key]
+    # Забираем исключение, даже если все ожидающие уже отменились
+    if not task.cancelled():
+        task.exception()
+
+
+async def single_flight(key, coro_factory):
+    """
+    Выполняет coro_factory() один раз для всех одновременных вызовов с одним ключом.
+
+    Пока вычисление по ключу идёт, новые вызовы не запускают его заново,
+    а ждут текущее и получают тот же результат (или то же исключение).
+    Отмена одного из ожидающих не отменяет общее вычисление.
+
+    Args:
+        key: хешируемый ключ единицы работы
+        coro_factory: функция без аргументов, возвращающая корутину
+    """
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(coro_factory())
+        _in_flight[key] = task
+        task.add_done_callback(lambda t: _forget(key, t))
+        _stats["started"] += 1
+    else:
+        _stats["coalesced"] += 1
+        logger.debug(f"Запрос {key!r} присоединён к уже выполняющемуся")
+    return await asyncio.shield(task)
+
+
+def get_single_flight_stats() -> dict:
+    """Возвращает число запущенных и объединённых вычислений."""
+    return dict(_stats, in_flight=len(_in_flight))
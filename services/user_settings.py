@@ -0,0 +1,178 @@
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+import logging
+import re
+
+import pytz
+
+from config import REPORT_HOUR, REPORT_MINUTE, DEFAULT_TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+SETTINGS_FILE = Path(__file__).parent.parent / "user_settings.json"
+
+TIMEZONE_ALIASES = {
+    "мск": "Europe/Moscow",
+    "msk": "Europe/Moscow",
+    "moscow": "Europe/Moscow",
+    "москва": "Europe/Moscow",
+}
+_TIMEZONES_BY_LOWER = {tz.lower(): tz for tz in pytz.all_timezones}
+
+
+def load_all_settings() -> dict:
+    """Загружает настройки рассылки всех пользователей."""
+    if SETTINGS_FILE.exists():
+        with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_all_settings(data: dict):
+    """Сохраняет настройки рассылки всех пользователей."""
+    with open(SETTINGS_FILE, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+def default_settings() -> dict:
+    """Настройки рассылки по умолчанию."""
+    return {"hour": REPORT_HOUR, "minute": REPORT_MINUTE, "timezone": DEFAULT_TIMEZONE}
+
+
+def get_user_settings(chat_id: int, data: dict = None) -> dict:
+    """
+    Возвращает время и часовой пояс рассылки для чата.
+
+    Args:
+        chat_id: ID чата
+        data: уже загруженные настройки (чтобы не читать файл на каждый чат)
+    """
+    if data is None:
+        data = load_all_settings()
+    settings = default_settings()
+    settings.update(data.get(str(chat_id), {}))
+    return settings
+
+
+def update_user_settings(chat_id: int, **changes) -> dict:
+    """Обновляет настройки рассылки чата и возвращает итоговые."""
+    data = load_all_settings()
+    user_key = str(chat_id)
+    settings = get_user_settings(chat_id, data)
+    settings.update(changes)
+    data[user_key] = settings
+    save_all_settings(data)
+    return settings
+
+
+def parse_time(text: str):
+    """
+    Разбирает время в формате ЧЧ:ММ (допускается ЧЧ.ММ и ЧЧ).
+
+    Returns:
+        tuple: (час, минута) или None
+    """
+    match = re.fullmatch(r'(\d{1,2})(?:[:.](\d{2}))?', text.strip())
+    if not match:
+        return None
+    hour = int(match.group(1))
+    minute = int(match.group(2) or 0)
+    if hour > 23 or minute > 59:
+        return None
+    return hour, minute
+
+
+def parse_timezone(text: str):
+    """
+    Разбирает часовой пояс.
+
+    Поддерживает:
+    - Europe/Moscow (названия IANA, без учёта регистра)
+    - МСК
+    - UTC+5, GMT-3, +3
+
+    Returns:
+        str: название часового пояса или None
+    """
+    text = text.strip()
+    lowered = text.lower()
+
+    if lowered in TIMEZONE_ALIASES:
+        return TIMEZONE_ALIASES[lowered]
+
+    if lowered in _TIMEZONES_BY_LOWER:
+        return _TIMEZONES_BY_LOWER[lowered]
+
+    # Смещения от UTC. Знак в зонах Etc/GMT инвертирован: UTC+3 == Etc/GMT-3
+    match = re.fullmatch(r'(?:utc|gmt)?\s*([+-])(\d{1,2})', lowered)
+    if match:
+        offset = int(match.group(2))
+        if offset > 14:
+            return None
+        if offset == 0:
+            return "UTC"
+        sign = "-" if match.group(1) == "+" else "+"
+        return f"Etc/GMT{sign}{offset}"
+
+    if lowered in ("utc", "gmt"):
+        return "UTC"
+
+    return None
+
+
+def set_user_delivery(chat_id: int, args: list) -> tuple:
+    """
+    Меняет время и/или часовой пояс рассылки по аргументам команды /time.
+
+    Returns:
+        tuple: (успех, сообщение)
+    """
+    changes = {}
+    for arg in args:
+        parsed_time = parse_time(arg)
+        if parsed_time and "hour" not in changes:
+            changes["hour"], changes["minute"] = parsed_time
+            continue
+        timezone = parse_timezone(arg)
+        if timezone and "timezone" not in changes:
+            changes["timezone"] = timezone
+            continue
+        return False, f"Не понял «{arg}». Пример: /time 08:30 Europe/Moscow"
+
+    if not changes:
+        return False, "Укажите время и/или часовой пояс. Пример: /time 08:30 UTC+3"
+
+    settings = update_user_settings(chat_id, **changes)
+    return True, f"Рассылка будет приходить в {format_delivery_time(settings)}"
+
+
+def format_delivery_time(settings: dict) -> str:
+    """Форматирует время рассылки для показа пользователю."""
+    return f"{settings['hour']:02d}:{settings['minute']:02d} ({settings['timezone']})"
+
+
+def next_delivery(settings: dict, after: datetime) -> datetime:
+    """
+    Возвращает ближайший момент рассылки строго после after.
+
+    Args:
+        settings: настройки рассылки чата
+        after: момент времени с часовым поясом
+
+    Returns:
+        datetime: момент рассылки в часовом поясе пользователя
+    """
+    try:
+        tz = pytz.timezone(settings["timezone"])
+    except pytz.UnknownTimeZoneError:
+        logger.warning(f"Неизвестный часовой пояс {settings['timezone']}, использую {DEFAULT_TIMEZONE}")
+        tz = pytz.timezone(DEFAULT_TIMEZONE)
+
+    local_after = after.astimezone(tz)
+    day = local_after.date()
+    candidate = tz.localize(datetime(day.year, day.month, day.day, settings["hour"], settings["minute"]))
+    if candidate <= local_after:
+        day += timedelta(days=1)
+        candidate = tz.localize(datetime(day.year, day.month, day.day, settings["hour"], settings["minute"]))
+    return candidate